@@ -1,5 +1,5 @@
 import os
-from .modules import client_config, pipeline, export, evaluator, translator
+from .modules import client_config, pipeline, export, linkcheck, evaluator, translator
 
 def main():
     print("Initializing OpenAI client...")
@@ -8,6 +8,11 @@ def main():
     #pipeline.main()
     print("Exporting results...")
     #export.main()
+    if os.environ.get("RUN_LINKCHECK") == "1":
+        print("Checking source URLs...")
+        linkcheck.main()
+    else:
+        print("Source link check skipped.")
     print("Running evaluation...")
     #evaluator.main()
     run_translation = os.environ.get("RUN_TRANSLATION")
@@ -1,28 +1,50 @@
 import os
 import csv
 import json
+import time
 from datetime import datetime, timezone
 from pathlib import Path
 from src.modules.client_config import client
+from src.modules.linkcheck import load_flagged_keys, row_key
 
 ARTIFACTS_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'outputs', 'processed', 'artifacts_export.csv')
 EVAL_OUTPUT_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'outputs', 'processed', 'artifacts_evaluation.csv')
+FLAGGED_EVAL_OUTPUT_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'outputs', 'processed', 'artifacts_evaluation_flagged.csv')
 
 MODEL_NAME = "gpt-5-mini"
 
+# Grouped review mode (EVAL_GROUPED=1)
+GROUP_TOKEN_BUDGET = 6000        # Max estimated input tokens per grouped review call
+CHARS_PER_TOKEN = 4              # Rough estimate for sizing groups
+
+# API errors (timeouts, 429s) are retried with backoff, never split
+MAX_RETRIES = 3
+BACKOFF_BASE_SECONDS = 5.0
+
+# Shared by the single and grouped review prompts
+REVIEWER_ROLE = (
+    "You are a legal expert reviewing the output of an AI model that searched the internet for legal basis for the question provided. "
+    "Your job is to review the AI's answer and sources. "
+)
+VERDICT_KEYS = (
+    "verdict (one of: 'Correct', 'Incorrect', 'Insufficient Evidence', 'Outdated Law'), "
+    "justification (short, reference specific sources), "
+    "corrected_answer (optional, if the original answer is wrong or incomplete), "
+    "replacement_citations (optional, array of up to 2 with title and url), "
+    "confidence (float, 0-1, 1 decimal). "
+)
+VERDICT_GUIDANCE = (
+    "If the answer is correct, justification should reference the sources and legal basis. "
+    "If insufficient, outdated, or incorrect, explain why and provide corrections if possible. "
+)
+
 def build_instructions():
     return (
-        "You are a legal expert reviewing the output of an AI model that searched the internet for legal basis for the question provided. "
-        "Your job is to review the AI's answer and sources. "
-        "Return STRICT JSON ONLY with these keys: "
-        "verdict (one of: 'Correct', 'Incorrect', 'Insufficient Evidence', 'Outdated Law'), "
-        "justification (short, reference specific sources), "
-        "corrected_answer (optional, if the original answer is wrong or incomplete), "
-        "replacement_citations (optional, array of up to 2 with title and url), "
-        "confidence (float, 0-1, 1 decimal). "
-        "If the answer is correct, justification should reference the sources and legal basis. "
-        "If insufficient, outdated, or incorrect, explain why and provide corrections if possible. "
-        "Output STRICT JSON only, no prose or markdown."
+        REVIEWER_ROLE
+        + "Return STRICT JSON ONLY with these keys: "
+        + VERDICT_KEYS
+        + VERDICT_GUIDANCE
+        + "Output STRICT JSON only, no prose or markdown."
     )
 
 def build_input(row):
@@ -43,16 +65,58 @@ def build_input(row):
     )
     return input_text
 
-def main():
-    with open(ARTIFACTS_CSV, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        rows = list(reader)
+def build_group_instructions():
+    return (
+        REVIEWER_ROLE
+        + "You will receive several answers for the same economy, pillar and section, which often rest on the same legal sources; "
+        "research shared sources once and reuse them across answers. "
+        "For EACH answer, produce a verdict object with these keys: id (copied from the input), "
+        + VERDICT_KEYS
+        + VERDICT_GUIDANCE
+        + "Return STRICT JSON ONLY as an object: {\"verdicts\": [ ...one verdict object per answer... ]}, no prose or markdown."
+    )
 
-    results = []
-    instructions = build_instructions()
+def build_group_input(rows):
+    # Rows share economy, pillar and section; each answer gets a local id for keying verdicts
+    first = rows[0]
+    parts = [
+        f"Economy: {first.get('economy', '')}",
+        f"Pillar: {first.get('pillar', '')}",
+        f"Section: {first.get('section_name', '')}",
+        "",
+    ]
+    for i, row in enumerate(rows, start=1):
+        parts.append(f"[id: {i}]\n" + build_input(row))
+    return "\n".join(parts)
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
 
-    for idx, row in enumerate(rows):
-        input_text = build_input(row)
+def group_rows(rows):
+    """
+    Group rows by (economy, pillar, section_name), then split each group into chunks
+    whose estimated input size stays within GROUP_TOKEN_BUDGET.
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault((row.get('economy', ''), row.get('pillar', ''), row.get('section_name', '')), []).append(row)
+    chunks = []
+    for group in groups.values():
+        chunk, size = [], 0
+        for row in group:
+            tokens = estimate_tokens(build_input(row))
+            if chunk and size + tokens > GROUP_TOKEN_BUDGET:
+                chunks.append(chunk)
+                chunk, size = [], 0
+            chunk.append(row)
+            size += tokens
+        if chunk:
+            chunks.append(chunk)
+    return chunks
+
+def call_reviewer(instructions, input_text):
+    attempt = 0
+    while True:
         try:
             resp = client.responses.create(
                 model=MODEL_NAME,
@@ -67,42 +131,127 @@ def main():
                 },
                 store=True
             )
-            content = resp.output_text.strip()
-            verdict = None
-            justification = None
-            corrected_answer = None
-            replacement_citations = None
-            confidence = None
-            try:
-                parsed = json.loads(content)
-                verdict = parsed.get('verdict', '')
-                justification = parsed.get('justification', '')
-                corrected_answer = parsed.get('corrected_answer', '')
-                replacement_citations = parsed.get('replacement_citations', [])
-                confidence = parsed.get('confidence', '')
-            except Exception:
-                pass
-            results.append({
-                'timestamp': datetime.now(timezone.utc).isoformat(),
-                'question_number': row.get('question_number', ''),
-                'answer': row.get('answer', ''),
-                'verdict': verdict,
-                'justification': justification,
-                'corrected_answer': corrected_answer,
-                'replacement_citations': json.dumps(replacement_citations, ensure_ascii=False) if replacement_citations else '',
-                'confidence': confidence
-            })
-            print(f"[{idx+1}/{len(rows)}] {row.get('question_number', '')}: {verdict}")
+            return resp.output_text.strip()
         except Exception as e:
-            print(f"Error on row {idx+1}: {e}")
+            attempt += 1
+            if attempt > MAX_RETRIES:
+                raise
+            delay = BACKOFF_BASE_SECONDS * (2 ** (attempt - 1))
+            print(f"Retry {attempt} after error: {e}. Sleeping {delay:.0f}s...")
+            time.sleep(delay)
+
+def make_result(row, parsed):
+    # Unparseable replies keep empty (None) fields, parsed ones default to ''
+    default = '' if isinstance(parsed, dict) else None
+    parsed = parsed if isinstance(parsed, dict) else {}
+    replacement_citations = parsed.get('replacement_citations', [])
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'question_number': row.get('question_number', ''),
+        'answer': row.get('answer', ''),
+        'verdict': parsed.get('verdict', default),
+        'justification': parsed.get('justification', default),
+        'corrected_answer': parsed.get('corrected_answer', default),
+        'replacement_citations': json.dumps(replacement_citations, ensure_ascii=False) if replacement_citations else '',
+        'confidence': parsed.get('confidence', default)
+    }
+
+def parse_group_verdicts(content, count):
+    # Returns {id: verdict dict} for the ids 1..count present in the reply;
+    # raises ValueError only if the JSON or its shape is invalid
+    parsed = json.loads(content)
+    items = parsed.get('verdicts', []) if isinstance(parsed, dict) else parsed
+    if not isinstance(items, list):
+        raise ValueError("expected a list of verdicts")
+    by_id = {str(item.get('id')).strip(): item for item in items if isinstance(item, dict)}
+    return {str(i): by_id[str(i)] for i in range(1, count + 1) if str(i) in by_id}
+
+def review_single(row):
+    content = call_reviewer(build_instructions(), build_input(row))
+    try:
+        parsed = json.loads(content)
+    except Exception:
+        parsed = None
+    return make_result(row, parsed)
+
+def review_group(rows, results):
+    """
+    Review a group in one call, appending one result per answer to `results`.
+    Verdicts that come back are kept; only answers missing from the reply are
+    reviewed again. If the reply cannot be parsed (or has no usable verdicts),
+    split the group in half and retry each part. If the API call still fails
+    after retries, the answers get empty results so earlier verdicts are never lost.
+    """
+    try:
+        if len(rows) == 1:
+            results.append(review_single(rows[0]))
+            return
+        content = call_reviewer(build_group_instructions(), build_group_input(rows))
+    except Exception as e:
+        print(f"Review of {len(rows)} answers failed: {e}")
+        results.extend(make_result(row, None) for row in rows)
+        return
+    try:
+        by_id = parse_group_verdicts(content, len(rows))
+        if not by_id:
+            raise ValueError("no verdicts for the given ids")
+    except ValueError as e:
+        mid = len(rows) // 2
+        print(f"Group of {len(rows)} could not be parsed ({e}); splitting into {mid} + {len(rows) - mid}.")
+        review_group(rows[:mid], results)
+        review_group(rows[mid:], results)
+        return
+    missing = []
+    for i, row in enumerate(rows, start=1):
+        if str(i) in by_id:
+            results.append(make_result(row, by_id[str(i)]))
+        else:
+            missing.append(row)
+    if missing:
+        print(f"Group of {len(rows)} is missing {len(missing)} verdicts; reviewing those again.")
+        review_group(missing, results)
+
+def main():
+    with open(ARTIFACTS_CSV, 'r', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        rows = list(reader)
+
+    # EVAL_ONLY_FLAGGED=1 re-evaluates only answers whose sources failed the link check
+    output_csv = EVAL_OUTPUT_CSV
+    if os.environ.get("EVAL_ONLY_FLAGGED") == "1":
+        flagged = load_flagged_keys()
+        rows = [row for row in rows if row_key(row) in flagged]
+        output_csv = FLAGGED_EVAL_OUTPUT_CSV
+        print(f"Re-evaluating {len(rows)} answers with dead sources.")
+
+    results = []
+
+    # EVAL_GROUPED=1 reviews all answers for one (economy, pillar, section) per call
+    if os.environ.get("EVAL_GROUPED") == "1":
+        groups = group_rows(rows)
+        print(f"Reviewing {len(rows)} answers in {len(groups)} grouped calls.")
+        for idx, group in enumerate(groups):
+            first = group[0]
+            start = len(results)
+            review_group(group, results)
+            verdicts = ", ".join(f"{r['question_number']}: {r['verdict']}" for r in results[start:])
+            print(f"[{idx+1}/{len(groups)}] {first.get('economy', '')} / {first.get('pillar', '')} / {first.get('section_name', '')}: {verdicts}")
+    else:
+        for idx, row in enumerate(rows):
+            try:
+                result = review_single(row)
+                results.append(result)
+                print(f"[{idx+1}/{len(rows)}] {row.get('question_number', '')}: {result['verdict']}")
+            except Exception as e:
+                print(f"Error on row {idx+1}: {e}")
 
     # Write results to CSV
-    with open(EVAL_OUTPUT_CSV, 'w', encoding='utf-8', newline='') as f:
+    with open(output_csv, 'w', encoding='utf-8', newline='') as f:
         fieldnames = ['timestamp', 'question_number', 'answer', 'verdict', 'justification', 'corrected_answer', 'replacement_citations', 'confidence']
         writer = csv.DictWriter(f, fieldnames=fieldnames)
         writer.writeheader()
         writer.writerows(results)
-    print(f"Evaluation complete. Results saved to {EVAL_OUTPUT_CSV}")
+    print(f"Evaluation complete. Results saved to {output_csv}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
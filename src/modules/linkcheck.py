@@ -0,0 +1,226 @@
+import os
+import csv
+import json
+import ssl
+import time
+import asyncio
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Any, Iterable, Optional
+from urllib.parse import urlsplit
+import certifi
+import httpx
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+ARTIFACTS_CSV = os.path.join(ROOT_DIR, 'outputs', 'processed', 'artifacts_export.csv')
+LINKCHECK_OUTPUT_CSV = os.path.join(ROOT_DIR, 'outputs', 'processed', 'artifacts_linkcheck.csv')
+LINKCHECK_CACHE_PATH = Path(ROOT_DIR) / "outputs" / "raw" / "linkcheck_cache.json"
+
+# Operational parameters
+MAX_CONCURRENCY = 20             # Total in-flight requests
+PER_HOST_CONCURRENCY = 2         # In-flight requests per host (be polite to gazettes)
+HTTP_TIMEOUT_SECS = 20
+MAX_REDIRECTS = 10
+CACHE_TTL_SECONDS = 7 * 24 * 3600       # Live results are trusted for a week
+DEAD_CACHE_TTL_SECONDS = 6 * 3600       # Dead/unknown results are re-checked sooner (may be transient)
+USER_AGENT = "Mozilla/5.0 (compatible; ai-legal-pipeline-linkcheck/1.0)"
+
+# Bot-blocking (common on government sites) and throttling say nothing about the
+# page itself; these, 5xx, timeouts and TLS errors are recorded as 'unknown' and
+# do not flag the answer
+UNKNOWN_STATUSES = {401, 403, 429}
+
+# Per-URL failures recorded as results rather than aborting the batch
+# (LLM-generated URLs can be malformed: httpx.InvalidURL is not an HTTPError)
+CHECK_ERRORS = (httpx.HTTPError, httpx.InvalidURL, ValueError)
+
+COLUMNS = [
+    'economy', 'pillar', 'section_name', 'question_number',
+    'source_1_url', 'source_1_status', 'source_1_final_url', 'source_1_state',
+    'source_2_url', 'source_2_status', 'source_2_final_url', 'source_2_state',
+    'dead_sources', 'unknown_sources', 'needs_review'
+]
+
+# Cache stored as a simple JSON dict keyed by URL
+
+def load_cache(path: Path = LINKCHECK_CACHE_PATH) -> Dict[str, Any]:
+    if path.exists():
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except Exception:
+            return {}
+    return {}
+
+
+def save_cache(cache: Dict[str, Any], path: Path = LINKCHECK_CACHE_PATH) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(cache, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+def is_transient_error(exc: Optional[BaseException]) -> bool:
+    # Timeouts and TLS handshake failures (the ssl.SSLError sits in the exception chain)
+    if isinstance(exc, httpx.TimeoutException):
+        return True
+    while exc is not None:
+        if isinstance(exc, ssl.SSLError):
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+def classify(status: Optional[int], exc: Optional[BaseException] = None) -> str:
+    # 'live', 'dead' or 'unknown'; no status means the request itself failed
+    if status is None:
+        return "unknown" if is_transient_error(exc) else "dead"
+    if status < 400:
+        return "live"
+    if status in UNKNOWN_STATUSES or status >= 500:
+        return "unknown"
+    return "dead"
+
+
+def is_fresh(entry: Dict[str, Any], now: Optional[float] = None) -> bool:
+    now = time.time() if now is None else now
+    ttl = CACHE_TTL_SECONDS if entry.get("state") == "live" else DEAD_CACHE_TTL_SECONDS
+    return now - float(entry.get("checked_at", 0)) < ttl
+
+
+def build_ssl_context() -> ssl.SSLContext:
+    # Same certificate handling as client_config, without requiring an API key
+    cafile = os.getenv("CERTIFICATE_PATH") or certifi.where()
+    return ssl.create_default_context(cafile=cafile)
+
+
+def _result(url: str, method: str, resp: Optional[httpx.Response], error: str = "",
+            exc: Optional[BaseException] = None) -> Dict[str, Any]:
+    status = resp.status_code if resp is not None else None
+    return {
+        "url": url,
+        "method": method,
+        "status": status,
+        "final_url": str(resp.url) if resp is not None else "",
+        "redirects": [str(r.url) for r in resp.history] if resp is not None else [],
+        "state": classify(status, exc),
+        "error": error,
+        "checked_at": time.time(),
+    }
+
+
+async def check_url(http: httpx.AsyncClient, url: str) -> Dict[str, Any]:
+    """
+    Check one URL: HEAD first, then GET (body not downloaded) if HEAD fails
+    or returns an error status (some servers reject or mishandle HEAD).
+    """
+    head_error = ""
+    try:
+        resp = await http.head(url)
+        if resp.status_code < 400:
+            return _result(url, "HEAD", resp)
+    except CHECK_ERRORS as e:
+        head_error = f"HEAD: {type(e).__name__}: {e}"
+    try:
+        async with http.stream("GET", url) as resp:
+            return _result(url, "GET", resp)
+    except CHECK_ERRORS as e:
+        error = f"GET: {type(e).__name__}: {e}"
+        return _result(url, "GET", None, "; ".join(x for x in (head_error, error) if x), e)
+
+
+async def check_urls(urls: Iterable[str], cache: Optional[Dict[str, Any]] = None,
+                     verify: Any = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Check a collection of URLs concurrently, reusing fresh cache entries.
+    Each distinct URL is requested at most once; fresh results are written back into `cache`.
+    """
+    cache = {} if cache is None else cache
+    unique = list(dict.fromkeys(u.strip() for u in urls if u and u.strip()))
+    results: Dict[str, Dict[str, Any]] = {u: cache[u] for u in unique if u in cache and is_fresh(cache[u])}
+    pending = [u for u in unique if u not in results]
+    if not pending:
+        return results
+
+    global_limit = asyncio.Semaphore(MAX_CONCURRENCY)
+    host_limits: Dict[str, asyncio.Semaphore] = {}
+
+    async def run(http: httpx.AsyncClient, url: str):
+        try:
+            host = urlsplit(url).netloc.lower()
+        except ValueError as e:
+            return _result(url, "", None, f"{type(e).__name__}: {e}", e)
+        host_limit = host_limits.setdefault(host, asyncio.Semaphore(PER_HOST_CONCURRENCY))
+        # Host slot first, so URLs queued on a slow host do not hold global slots
+        async with host_limit:
+            async with global_limit:
+                return await check_url(http, url)
+
+    limits = httpx.Limits(max_connections=MAX_CONCURRENCY, max_keepalive_connections=MAX_CONCURRENCY)
+    async with httpx.AsyncClient(
+        verify=build_ssl_context() if verify is None else verify,
+        timeout=HTTP_TIMEOUT_SECS,
+        follow_redirects=True,
+        max_redirects=MAX_REDIRECTS,
+        limits=limits,
+        headers={"User-Agent": USER_AGENT},
+    ) as http:
+        checked = await asyncio.gather(*(run(http, u) for u in pending))
+
+    for entry in checked:
+        results[entry["url"]] = entry
+        cache[entry["url"]] = entry
+    return results
+
+
+def row_key(row: Dict[str, Any]) -> tuple:
+    return tuple(str(row.get(c, '')) for c in ('economy', 'pillar', 'section_name', 'question_number'))
+
+
+def load_flagged_keys(path: str = LINKCHECK_OUTPUT_CSV) -> set:
+    """
+    Return the (economy, pillar, section_name, question_number) keys of answers
+    with at least one dead source (not merely unknown), as written by main().
+    """
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'r', encoding='utf-8') as f:
+        return {row_key(row) for row in csv.DictReader(f) if row.get('needs_review') == 'True'}
+
+
+def main():
+    with open(ARTIFACTS_CSV, 'r', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+
+    cache = load_cache()
+    urls = [row.get(f'source_{i}_url', '') for row in rows for i in (1, 2)]
+    results = asyncio.run(check_urls(urls, cache))
+    save_cache(cache)
+
+    out_rows = []
+    for row in rows:
+        out = {c: row.get(c, '') for c in ('economy', 'pillar', 'section_name', 'question_number')}
+        dead = unknown = 0
+        for i in (1, 2):
+            url = (row.get(f'source_{i}_url') or '').strip()
+            entry = results.get(url, {})
+            out[f'source_{i}_url'] = url
+            out[f'source_{i}_status'] = entry.get('status') or entry.get('error', '')
+            out[f'source_{i}_final_url'] = entry.get('final_url', '')
+            out[f'source_{i}_state'] = entry.get('state', '') if url else ''
+            if url and entry.get('state') == 'dead':
+                dead += 1
+            elif url and entry.get('state') == 'unknown':
+                unknown += 1
+        out['dead_sources'] = dead
+        out['unknown_sources'] = unknown
+        out['needs_review'] = dead > 0
+        out_rows.append(out)
+
+    with open(LINKCHECK_OUTPUT_CSV, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(out_rows)
+    flagged = sum(1 for r in out_rows if r['needs_review'])
+    print(f"Checked {len(results)} unique URLs at {datetime.now(timezone.utc).isoformat()}; "
+          f"{flagged}/{len(out_rows)} answers have dead sources. Results saved to {LINKCHECK_OUTPUT_CSV}")
+
+if __name__ == "__main__":
+    main()
@@ -4,17 +4,23 @@
 import json
 import time
 import hashlib
-from datetime import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Dict, Any, List
 from pathlib import Path
 import pandas as pd
 from IPython.display import display
 from src.modules.client_config import client
+from src.modules.scheduler import build_cost_model, schedule, priorities_from_env
 
 # Model and operational parameters
 MODEL_NAME = "gpt-5-mini"
 RATE_LIMIT_RPM = 20              # Per-minute cap
+RATE_LIMIT_TPM = 200_000         # Tokens-per-minute cap (estimated up front, settled with actual usage)
+MAX_WORKERS = 4                  # Concurrent requests
+MAX_QUESTIONS = 1                # Questions per economy (None = all)
 MAX_RETRIES = 5                  # Exponential backoff tries
 BACKOFF_BASE_SECONDS = 2.0       # Initial backoff delay
 BACKOFF_CAP_SECONDS = 30.0       # Max backoff delay
@@ -90,8 +96,11 @@ def load_cache() -> Dict[str, Any]:
     return {}
 
 
+_cache_lock = threading.RLock()   # Workers update and save the shared cache
+
 def save_cache(cache: Dict[str, Any]) -> None:
-    CACHE_PATH.write_text(json.dumps(cache, ensure_ascii=False, indent=2), encoding="utf-8")
+    with _cache_lock:
+        CACHE_PATH.write_text(json.dumps(cache, ensure_ascii=False, indent=2), encoding="utf-8")
 
 
 # RPM rate limiter
@@ -99,20 +108,51 @@ class RateLimiter:
     def __init__(self, rpm: int):
         self.rpm = max(1, int(rpm))
         self._times: List[float] = []
+        self._lock = threading.Lock()
 
     def acquire(self):
-        now = time.time()
-        window = now - 60.0
-        self._times = [t for t in self._times if t >= window]
-        if len(self._times) >= self.rpm:
-            sleep_for = self._times[0] + 60.0 - now
-            if sleep_for > 0:
-                time.sleep(sleep_for)
-        self._times.append(time.time())
+        with self._lock:
+            now = time.time()
+            window = now - 60.0
+            self._times = [t for t in self._times if t >= window]
+            if len(self._times) >= self.rpm:
+                sleep_for = self._times[0] + 60.0 - now
+                if sleep_for > 0:
+                    time.sleep(sleep_for)
+            self._times.append(time.time())
 
 rate_limiter = RateLimiter(RATE_LIMIT_RPM)
 
 
+# TPM limiter: reserve an estimate before the call, settle with actual usage after
+class TokenRateLimiter:
+    def __init__(self, tpm: int):
+        self.tpm = max(1, int(tpm))
+        self._entries: List[List[float]] = []   # [timestamp, tokens]
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float) -> List[float]:
+        while True:
+            with self._lock:
+                now = time.time()
+                self._entries = [e for e in self._entries if e[0] >= now - 60.0]
+                used = sum(e[1] for e in self._entries)
+                # Always admit when idle, so one oversized request cannot block forever
+                if not self._entries or used + tokens <= self.tpm:
+                    entry = [now, float(tokens)]
+                    self._entries.append(entry)
+                    return entry
+                sleep_for = self._entries[0][0] + 60.0 - now
+            time.sleep(max(0.1, sleep_for))
+
+    def settle(self, entry: List[float], actual_tokens: Any) -> None:
+        if isinstance(actual_tokens, (int, float)):
+            with self._lock:
+                entry[1] = float(actual_tokens)
+
+token_limiter = TokenRateLimiter(RATE_LIMIT_TPM)
+
+
 def with_retries(fn):
     def wrapped(*args, **kwargs):
         attempt = 0
@@ -147,25 +187,48 @@ def cache_key_for(economy: str, row: Any) -> str:
 
 print("Utilities initialized.")
 # Cell 8: Responses API helper
+def total_tokens_of(resp) -> Any:
+    # Usage metric (if available), converted to int where possible
+    usage = getattr(resp, "usage", None)
+    if usage is None:
+        return None
+    if isinstance(usage, dict):
+        return usage.get("total_tokens")
+    if hasattr(usage, "total_tokens"):
+        return usage.total_tokens
+    return int(usage) if isinstance(usage, (int, float, str)) else None
+
+
 @with_retries
-def call_responses_api(instructions: str, input_text: str):
+def call_responses_api(instructions: str, input_text: str, est_tokens: float):
     """
     Minimal wrapper for Responses API.
-    Returns the response object.
+    Each attempt reserves est_tokens against the TPM limit and settles it with actual usage.
+    Returns (response, latency_secs); latency covers only the API call,
+    not rate-limit waits or retry backoff.
     """
-    return client.responses.create(
-        model=MODEL_NAME,
-        instructions=instructions,
-        input=input_text,
-        tools=[{"type": "web_search_preview",
-                "search_context_size": "low"
-        }],
-        reasoning={
-        "effort": "low"
-        },
-        store=True,
-        timeout=300,
-    )
+    reservation = token_limiter.acquire(est_tokens)
+    started = time.time()
+    try:
+        resp = client.responses.create(
+            model=MODEL_NAME,
+            instructions=instructions,
+            input=input_text,
+            tools=[{"type": "web_search_preview",
+                    "search_context_size": "low"
+            }],
+            reasoning={
+            "effort": "low"
+            },
+            store=True,
+            timeout=300,
+        )
+    except Exception:
+        # Failed attempts are not counted against the budget
+        token_limiter.settle(reservation, 0)
+        raise
+    token_limiter.settle(reservation, total_tokens_of(resp))
+    return resp, round(time.time() - started, 2)
 
 def build_instructions_and_input(economy: str, row: Any, extra_assumptions: List[str]):
     """
@@ -219,122 +282,147 @@ def build_instructions_and_input(economy: str, row: Any, extra_assumptions: List
 
 print("Responses API helpers ready.")
 
-def main():
-    import uuid
-    from datetime import timezone
+def process_cell(econ: str, row: Any, cache: Dict[str, Any], est_tokens: float):
+    """
+    Generate (or load from cache) one economy x question answer and write its artifact.
+    """
+    pillar = str(row.get("pillar", "")).strip()
+    section = str(row.get("section_name", "")).strip()
+    qnum = str(row.get("question_number", "")).strip()
+    rtype = str(row.get("response_type", "")).strip().lower()
 
-    cache = load_cache()
+    key = cache_key_for(econ, row)
 
-    econ_col = "economy_name"
-    if econ_col not in economies_df.columns:
-        raise KeyError(f"Expected column '{econ_col}' in economies.csv; found: {list(economies_df.columns)}")
+    if (not FORCE_REGENERATE) and key in cache:
+        cached = cache[key]
+        content = cached.get("content", "")
+        structured = cached.get("structured")
+        usage_total_tokens = cached.get("usage_total_tokens")
+        latency_secs = cached.get("latency_secs")
+    else:
+        extra_assumps = applicable_assumptions(pillar, section)
+        instructions, input_text = build_instructions_and_input(econ, row, extra_assumps)
 
-    economies = [str(x) for x in economies_df[econ_col].dropna().astype(str).unique()]
+        resp, latency_secs = call_responses_api(instructions, input_text, est_tokens)
 
-    for econ in economies:
-        for idx, row in questions_df.head(1).iterrows():
-            pillar = str(row.get("pillar", "")).strip()
-            section = str(row.get("section_name", "")).strip()
-            qnum = str(row.get("question_number", "")).strip()
-            rtype = str(row.get("response_type", "")).strip().lower()
+        # Extract output text (Responses API)
+        try:
+            content = resp.output_text.strip()
+        except Exception:
+            content = ""
 
-            key = cache_key_for(econ, row)
+        # Parse JSON content if possible
+        structured = None
+        try:
+            structured = json.loads(content)
+        except Exception:
+            structured = None
 
-            if (not FORCE_REGENERATE) and key in cache:
-                cached = cache[key]
-                content = cached.get("content", "")
-                structured = cached.get("structured")
-                usage_total_tokens = cached.get("usage_total_tokens")
-            else:
-                extra_assumps = applicable_assumptions(pillar, section)
-                instructions, input_text = build_instructions_and_input(econ, row, extra_assumps)
-
-                resp = call_responses_api(instructions, input_text)
-
-                # Extract output text (Responses API)
-                try:
-                    content = resp.output_text.strip()
-                except Exception:
-                    content = ""
-
-                # Parse JSON content if possible
-                structured = None
-                try:
-                    structured = json.loads(content)
-                except Exception:
-                    structured = None
-
-                # Usage metric (if available)
-                usage_total_tokens = getattr(resp, "usage", None)
-                # --- Fix: convert to int if possible ---
-                if usage_total_tokens is not None:
-                    if isinstance(usage_total_tokens, dict):
-                        usage_total_tokens = usage_total_tokens.get("total_tokens")
-                    elif hasattr(usage_total_tokens, "total_tokens"):
-                        usage_total_tokens = usage_total_tokens.total_tokens
-                    else:
-                        usage_total_tokens = int(usage_total_tokens) if isinstance(usage_total_tokens, (int, float, str)) else None
-
-                cache[key] = {
-                    "economy": econ,
-                    "pillar": pillar,
-                    "section_name": section,
-                    "question_number": qnum,
-                    "response_type": rtype,
-                    "content": content,
-                    "structured": structured,
-                    "usage_total_tokens": usage_total_tokens  # Now always serializable
-                }
-                save_cache(cache)
-
-            out_dir = ARTIFACTS_DIR / sanitize_filename(econ) / sanitize_filename(pillar) / sanitize_filename(section)
-            out_dir.mkdir(parents=True, exist_ok=True)
-            out_path = out_dir / f"{sanitize_filename(qnum)}.json"
-
-            sources = None
-            reasoning = None
-            answer_or_value = None
-            confidence = None
-            try:
-                if isinstance(structured, dict):
-                    sources = structured.get("sources")
-                    reasoning = structured.get("reasoning")
-                    confidence = structured.get("confidence")
-                    if rtype == "integer":
-                        answer_or_value = structured.get("value")
-                    else:
-                        answer_or_value = structured.get("answer")
-            except Exception:
-                pass
-
-            artifact = {
-                "timestamp": datetime.now(timezone.utc).isoformat(),
+        usage_total_tokens = total_tokens_of(resp)
+
+        with _cache_lock:
+            cache[key] = {
                 "economy": econ,
-                "question": {
-                    "pillar": str(row.get("pillar", "")),
-                    "section_name": str(row.get("section_name", "")),
-                    "question_number": str(row.get("question_number", "")),
-                    "question_text": str(row.get("question_text", "")),
-                    "response_type": rtype,
-                    "hint": str(row.get("hint", "")),
-                },
-                "assumptions_used": applicable_assumptions(pillar, section),
-                "model": MODEL_NAME,
-                "usage": {"total_tokens": usage_total_tokens},
-                "output": {
-                    "raw": content,
-                    "structured": structured,
-                    "reasoning": reasoning,
-                    "sources": sources,
-                    "confidence": confidence,
-                    "answer": answer_or_value if rtype != "integer" else None,
-                    "value": answer_or_value if rtype == "integer" else None,
-                },
+                "pillar": pillar,
+                "section_name": section,
+                "question_number": qnum,
+                "response_type": rtype,
+                "content": content,
+                "structured": structured,
+                "usage_total_tokens": usage_total_tokens,  # Now always serializable
+                "latency_secs": latency_secs
             }
+            save_cache(cache)
+
+    out_dir = ARTIFACTS_DIR / sanitize_filename(econ) / sanitize_filename(pillar) / sanitize_filename(section)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    out_path = out_dir / f"{sanitize_filename(qnum)}.json"
+
+    sources = None
+    reasoning = None
+    answer_or_value = None
+    confidence = None
+    try:
+        if isinstance(structured, dict):
+            sources = structured.get("sources")
+            reasoning = structured.get("reasoning")
+            confidence = structured.get("confidence")
+            if rtype == "integer":
+                answer_or_value = structured.get("value")
+            else:
+                answer_or_value = structured.get("answer")
+    except Exception:
+        pass
+
+    artifact = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "economy": econ,
+        "question": {
+            "pillar": str(row.get("pillar", "")),
+            "section_name": str(row.get("section_name", "")),
+            "question_number": str(row.get("question_number", "")),
+            "question_text": str(row.get("question_text", "")),
+            "response_type": rtype,
+            "hint": str(row.get("hint", "")),
+        },
+        "assumptions_used": applicable_assumptions(pillar, section),
+        "model": MODEL_NAME,
+        "usage": {"total_tokens": usage_total_tokens, "latency_secs": latency_secs},
+        "output": {
+            "raw": content,
+            "structured": structured,
+            "reasoning": reasoning,
+            "sources": sources,
+            "confidence": confidence,
+            "answer": answer_or_value if rtype != "integer" else None,
+            "value": answer_or_value if rtype == "integer" else None,
+        },
+    }
+
+    out_path.write_text(json.dumps(artifact, ensure_ascii=False, indent=2), encoding="utf-8")
+    return out_path
 
-            out_path.write_text(json.dumps(artifact, ensure_ascii=False, indent=2), encoding="utf-8")
 
-            print(f"   ✅ Done {idx + 1}/{len(questions_df)}")
+def main():
+    cache = load_cache()
+
+    econ_col = "economy_name"
+    if econ_col not in economies_df.columns:
+        raise KeyError(f"Expected column '{econ_col}' in economies.csv; found: {list(economies_df.columns)}")
+
+    economies = [str(x) for x in economies_df[econ_col].dropna().astype(str).unique()]
+    rows = questions_df if MAX_QUESTIONS is None else questions_df.head(MAX_QUESTIONS)
+
+    # One cell per economy x question, dispatched longest-expected-first within priority class
+    cells = [
+        {
+            "economy": econ,
+            "row": row,
+            "pillar": str(row.get("pillar", "")).strip(),
+            "section_name": str(row.get("section_name", "")).strip(),
+            "question_number": str(row.get("question_number", "")).strip(),
+            "response_type": str(row.get("response_type", "")).strip().lower(),
+            "cached": (not FORCE_REGENERATE) and cache_key_for(econ, row) in cache,
+        }
+        for econ in economies
+        for _, row in rows.iterrows()
+    ]
+    cells = schedule(cells, build_cost_model(cache, ARTIFACTS_DIR), priorities_from_env())
+    expected = sum(c["est_latency"] for c in cells)
+    print(f"Scheduled {len(cells)} cells (~{expected / max(1, MAX_WORKERS) / 60:.1f} min at {MAX_WORKERS} workers).")
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {
+            executor.submit(process_cell, c["economy"], c["row"], cache, c["est_tokens"]): c
+            for c in cells
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            c = futures[future]
+            try:
+                future.result()
+                print(f"   ✅ Done {done}/{len(cells)}: {c['economy']} {c['question_number']}")
+            except Exception as e:
+                print(f"   ❌ Failed {done}/{len(cells)}: {c['economy']} {c['question_number']}: {e}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
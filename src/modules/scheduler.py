@@ -0,0 +1,106 @@
+import os
+import json
+from collections import defaultdict
+from pathlib import Path
+from statistics import mean
+from typing import Dict, Any, List, Optional, Tuple
+
+# Fallback estimates when there is no history for a question or section
+DEFAULT_TOKENS = {"integer": 15000, "yes_no": 8000}
+SECONDS_PER_1K_TOKENS = 2.5      # Rough latency per 1k total tokens, used when only tokens are known
+
+
+class CostModel:
+    """
+    Per-cell latency/token estimates learned from past runs.
+    Lookup order: same (pillar, section, question) -> same (pillar, section) -> response type default.
+    Section names repeat across pillars, so the pillar is part of every key.
+    """
+
+    def __init__(self):
+        self._by_question: Dict[Tuple[str, str, str], Dict[str, List[float]]] = defaultdict(lambda: defaultdict(list))
+        self._by_section: Dict[Tuple[str, str], Dict[str, List[float]]] = defaultdict(lambda: defaultdict(list))
+
+    def add(self, pillar: str, section: str, qnum: str, tokens: Any = None, latency: Any = None) -> None:
+        pillar, section, qnum = (str(x or "").strip() for x in (pillar, section, qnum))
+        for metric, value in (("tokens", tokens), ("latency", latency)):
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                continue
+            if value > 0:
+                self._by_question[(pillar, section, qnum)][metric].append(value)
+                self._by_section[(pillar, section)][metric].append(value)
+
+    def _lookup(self, pillar: str, section: str, qnum: str, metric: str) -> Optional[float]:
+        for samples in (self._by_question.get((pillar, section, qnum), {}), self._by_section.get((pillar, section), {})):
+            if samples.get(metric):
+                return mean(samples[metric])
+        return None
+
+    def estimate(self, pillar: str, section: str, qnum: str, rtype: str = "") -> Dict[str, float]:
+        pillar, section, qnum = (str(x or "").strip() for x in (pillar, section, qnum))
+        tokens = self._lookup(pillar, section, qnum, "tokens")
+        if tokens is None:
+            tokens = DEFAULT_TOKENS.get(str(rtype).strip().lower(), max(DEFAULT_TOKENS.values()))
+        latency = self._lookup(pillar, section, qnum, "latency")
+        if latency is None:
+            latency = tokens / 1000.0 * SECONDS_PER_1K_TOKENS
+        return {"tokens": tokens, "latency": latency}
+
+
+def build_cost_model(cache: Dict[str, Any], artifacts_dir: Optional[Path] = None) -> CostModel:
+    """
+    Build a CostModel from cache entries and (optionally) artifact telemetry.
+    """
+    model = CostModel()
+    for entry in cache.values():
+        if isinstance(entry, dict):
+            model.add(entry.get("pillar"), entry.get("section_name"), entry.get("question_number"),
+                      entry.get("usage_total_tokens"), entry.get("latency_secs"))
+    if artifacts_dir is not None and Path(artifacts_dir).exists():
+        for path in Path(artifacts_dir).rglob("*.json"):
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+            except Exception:
+                continue
+            question = data.get("question", {}) or {}
+            usage = data.get("usage", {}) or {}
+            model.add(question.get("pillar"), question.get("section_name"), question.get("question_number"),
+                      usage.get("total_tokens"), usage.get("latency_secs"))
+    return model
+
+
+def parse_priorities(value: Optional[str]) -> Dict[str, int]:
+    """
+    Parse a comma-separated list of economies, highest priority first
+    (e.g. PRIORITY_ECONOMIES="Norway,Chile"). Unlisted economies come last.
+    """
+    names = [x.strip() for x in (value or "").split(",") if x.strip()]
+    return {name: rank for rank, name in enumerate(names)}
+
+
+def schedule(cells: List[Dict[str, Any]], model: CostModel,
+             priorities: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
+    """
+    Order work cells by priority class, then longest expected latency first.
+    Each cell needs 'economy', 'pillar', 'section_name', 'question_number', 'response_type';
+    'est_tokens' and 'est_latency' are filled in. Cells marked 'cached' are served
+    from the cache without an API call, so they get zero estimates and go last.
+    """
+    priorities = priorities or {}
+    lowest = len(priorities)
+    for cell in cells:
+        if cell.get("cached"):
+            cell["est_tokens"] = 0
+            cell["est_latency"] = 0.0
+            continue
+        est = model.estimate(cell.get("pillar"), cell.get("section_name"), cell.get("question_number"),
+                             cell.get("response_type", ""))
+        cell["est_tokens"] = est["tokens"]
+        cell["est_latency"] = est["latency"]
+    return sorted(cells, key=lambda c: (priorities.get(str(c.get("economy")), lowest), -c["est_latency"]))
+
+
+def priorities_from_env() -> Dict[str, int]:
+    return parse_priorities(os.environ.get("PRIORITY_ECONOMIES"))